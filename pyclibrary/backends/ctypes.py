@@ -61,6 +61,9 @@ from ..utils import find_library
 
 logger = logging.getLogger(__name__)
 
+#: ctypes types having a dedicated pointer type.
+_SPECIAL_POINTER_TYPES = {None: c_void_p, c_char: c_char_p, c_wchar: c_wchar_p}
+
 
 def make_mess(mess):
     return cleandoc(mess).replace("\n", " ")
@@ -175,7 +178,7 @@ class CTypesCLibrary(CLibrary):
         """
         try:
             typ = list(self._headers_.eval_type(typ))
-            mods = typ[1:][:]
+            mods = typ[1:]
 
             # Create the initial type
             # Some types like ['char', '*'] have a specific ctype (c_char_p)
@@ -214,16 +217,16 @@ class CTypesCLibrary(CLibrary):
             # Go through the modifier looking for array modifiers.
             # Array modifiers are list and if we find consecutive modifiers we merge
             # them. This allows to iterate on them in reverse order to create the
-            # proper ctypes type
-            if len(mods):
-                seen = mods[0]
-                for m in mods[1:]:
-                    if isinstance(seen, list) and isinstance(m, list):
-                        seen += m
-                    else:
-                        n_mods.append(seen)
-                        seen = m
-                n_mods.append(seen)
+            # proper ctypes type. The lists are shared with the parsed definitions
+            # so they must not be extended in place.
+            prev_is_list = False
+            for m in mods:
+                is_list = isinstance(m, list)
+                if is_list and prev_is_list:
+                    n_mods[-1] = n_mods[-1] + m
+                else:
+                    n_mods.append(m)
+                prev_is_list = is_list
             mods = n_mods
 
             # Apply pointers and arrays
@@ -282,8 +285,8 @@ class CTypesCLibrary(CLibrary):
                     raise TypeError(mess.format(m))
             return cls
 
-        except:
-            logger.error("Error while processing type: {}".format(typ))
+        except Exception:
+            logger.error("Error while processing type: %s", typ)
             raise
 
     def _get_struct(self, str_type, str_name):
@@ -294,7 +297,7 @@ class CTypesCLibrary(CLibrary):
             defn = self._defs_[str_type][str_name]
 
             # create ctypes class
-            defs = defn["members"][:]
+            defs = defn["members"]
             if str_type == "structs":
 
                 class s(Structure):
@@ -312,32 +315,32 @@ class CTypesCLibrary(CLibrary):
             if defn["pack"] is not None:
                 s._pack_ = defn["pack"]
 
-            # Assign names to anonymous members
-            members = []
+            # Assign names to anonymous members and build the fields in a
+            # single pass.
+            members = set()
             anon = []
-            for i, d in enumerate(defs):
-                if d[0] is None:
+            fields = []
+            for m in defs:
+                name = m[0]
+                if name is None:
                     c = 0
                     while True:
                         name = "anon_member%d" % c
                         if name not in members:
-                            d = (name,) + d[1:]
-                            defs[i] = d
                             anon.append(name)
                             break
                         c += 1
-                members.append(d[0])
+                members.add(name)
+                # Handle bit field specifications, ctypes only supports bit
+                # fields for integer but I am not sure how to test for it in a
+                # nice fashion.
+                if m[2] is None:
+                    fields.append((name, self._get_type(m[1])))
+                else:
+                    fields.append((name, self._get_type(m[1]), m[2]))
 
             s._anonymous_ = anon
-            # Handle bit field specifications, ctypes only supports bit fields
-            # for integer but I am not sure how to test for it in a nice
-            # fashion.
-            s._fields_ = [
-                (m[0], self._get_type(m[1]))
-                if m[2] is None
-                else (m[0], self._get_type(m[1]), m[2])
-                for m in defs
-            ]
+            s._fields_ = fields
             s._defaults_ = [m[2] for m in defs]
 
         return self._structs_[str_name]
@@ -346,13 +349,13 @@ class CTypesCLibrary(CLibrary):
         """Build an uninitialised pointer for the given type."""
         # Must be 2-part type, second part must be '*' or '**'
         assert 2 <= len(arg_type) <= 3 and set(arg_type[1:]) == {"*"}
-        arg_type_list = list(arg_type)
+        # The outermost pointer level is provided by pointer() itself.
+        n_pointers = len(arg_type) - 2
         cls = self._get_type(sig, pointers=False)
-        special_pointer_types = {None: c_void_p, c_char: c_char_p, c_wchar: c_wchar_p}
-        if cls in special_pointer_types:
-            cls = special_pointer_types[cls]
-            del arg_type_list[1]
-        for pointer_decl in arg_type_list[1:-1]:
+        if cls in _SPECIAL_POINTER_TYPES:
+            cls = _SPECIAL_POINTER_TYPES[cls]
+            n_pointers -= 1
+        for _ in range(n_pointers):
             cls = POINTER(cls)
         return pointer(cls())
 
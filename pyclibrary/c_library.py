@@ -14,15 +14,32 @@ function calling based on C header definitions.
 import logging
 import os
 import sys
+from functools import cached_property
 from inspect import cleandoc
 from threading import RLock
 from weakref import WeakValueDictionary
 
-from .c_parser import CParser
+from .c_parser import CParser, Type
+from .errors import PyCLibError
 from .utils import LibraryPath, find_library
 
 logger = logging.getLogger(__name__)
 
+#: Calling conventions which may appear in the return type of a function.
+_CALL_CONVENTIONS = frozenset(("__stdcall", "__cdecl"))
+
+#: Order in which the definitions are searched when accessing an attribute.
+_LOOKUP_ORDER = ("values", "functions", "types", "structs", "unions", "enums")
+
+#: Kinds of definitions which can be accessed through a typedef.
+_ALIASABLE_KINDS = frozenset(("structs", "unions", "enums"))
+
+#: Lazily computed attributes which must never be looked up in the headers.
+_LAZY_ATTRS = frozenset(("_headers_", "_defs_", "_headers_args_"))
+
+#: Sentinel used to identify cache misses when None is a valid cached value.
+_MISSING = object()
+
 
 def make_mess(mess):
     return cleandoc(mess).replace("\n", " ")
@@ -127,8 +144,9 @@ class CLibrary(object, metaclass=CLibraryMeta):
     lib:
         Library object.
 
-    headers : unicode or CParser
-        Path to the header files or CParser holding all the definitions.
+    headers : list or CParser
+        Paths to the header files or CParser holding all the definitions.
+        Header files are parsed on the first access to the definitions.
 
     prefix : unicode, optional
         Prefix to remove from all definitions.
@@ -171,15 +189,15 @@ class CLibrary(object, metaclass=CLibraryMeta):
         # name everything using underscores to avoid name collisions with
         # library
 
-        # Build or store the parser from the header files.
+        # Store the parser or the header files from which to build it. Header
+        # files are only parsed on the first access to the definitions.
         if isinstance(headers, list):
-            self._headers_ = self._build_parser(headers, kwargs)
+            self._headers_args_ = (headers, kwargs)
         elif isinstance(headers, CParser):
             self._headers_ = headers
         else:
             msg = "Expected a CParser instance or list for headers, not {}"
             raise ValueError(msg.format(type(headers)))
-        self._defs_ = self._headers_.defs
 
         # Create or store the internal representation of the library.
         if isinstance(lib, str):
@@ -199,6 +217,9 @@ class CLibrary(object, metaclass=CLibraryMeta):
         if lock_calls:
             self._lock_ = RLock()
 
+        self._names_ = {}
+        self._type_cache_ = {}
+        self._type_cache_revision_ = 0
         self._objs_ = {}
         for k in ["values", "functions", "types", "structs", "unions", "enums"]:
             self._objs_[k] = {}
@@ -207,14 +228,16 @@ class CLibrary(object, metaclass=CLibraryMeta):
         self._unions_ = {}
 
     def __call__(self, typ, name):
-        if typ not in self._objs_:
+        objs = self._objs_.get(typ)
+        if objs is None:
             typs = self._objs_.keys()
             raise KeyError("Type must be one of {}".format(typs))
 
-        if name not in self._objs_[typ]:
-            self._objs_[typ][name] = self._make_obj_(typ, name)
+        obj = objs.get(name, _MISSING)
+        if obj is _MISSING:
+            obj = objs[name] = self._make_obj_(typ, name)
 
-        return self._objs_[typ][name]
+        return obj
 
     def __getattr__(self, name):
         """Used to retrieve any type of definition from the headers.
@@ -223,64 +246,97 @@ class CLibrary(object, metaclass=CLibraryMeta):
         values, functions, types, structs, unions, enums.
 
         """
-        if name not in self._all_objs_:
-            names = self._all_names_(name)
-            for k in [
-                "values",
-                "functions",
-                "types",
-                "structs",
-                "unions",
-                "enums",
-                None,
-            ]:
-                if k is None:
-                    raise NameError(name)
-                obj = None
-                for n in names:
-                    if n in self._defs_[k]:
-                        obj = self(k, n)
-                        break
-                if obj is not None:
+        # Do not look up the definitions for the lazy internals, or for the
+        # special methods probed by pickle or copy. Otherwise an AttributeError
+        # raised while building the definitions would recurse through here.
+        if name in _LAZY_ATTRS or (name[:2] == "__" == name[-2:] and name.islower()):
+            raise AttributeError(name)
+
+        obj = self._all_objs_.get(name, _MISSING)
+        if obj is not _MISSING:
+            return obj
+
+        names = self._all_names_(name)
+        defs = self._defs_
+        for k in _LOOKUP_ORDER:
+            obj = None
+            for n in names:
+                if n in defs[k]:
+                    obj = self(k, n)
                     break
-            self._all_objs_[name] = obj
-        return self._all_objs_[name]
+            if obj is not None:
+                break
+        else:
+            raise NameError(name)
+        self._all_objs_[name] = obj
+        return obj
 
     def __getitem__(self, name):
         """Used to retrieve a specific dictionary from the headers."""
         return self._defs_[name]
 
+    def __contains__(self, name):
+        """Check whether the headers provide a dictionary of that name."""
+        return name in self._defs_
+
     # --- Private API ---------------------------------------------------------
 
+    @cached_property
+    def _headers_(self):
+        """Parser holding the definitions, built from the headers on first
+        access.
+
+        """
+        headers, kwargs = self._headers_args_
+        try:
+            return self._build_parser(headers, kwargs)
+        except AttributeError as e:
+            # Python would treat an AttributeError raised by a property as a
+            # missing attribute and silently fall back on __getattr__.
+            msg = "Failed to parse the headers {}"
+            raise PyCLibError(msg.format(headers)) from e
+
+    @cached_property
+    def _defs_(self):
+        """Definitions extracted from the headers."""
+        return self._headers_.defs
+
     def _all_names_(self, name):
-        """Build a list of all possible names by taking into account that
+        """Build a tuple of all possible names by taking into account that
         the user omitted a prefix.
 
         """
-        return [name] + [p + name for p in self._prefix_]
+        names = self._names_.get(name)
+        if names is None:
+            names = (name, *[p + name for p in self._prefix_])
+            self._names_[name] = names
+        return names
 
     def _make_obj_(self, typ, name):
         """Build the correct C-like object from the header definitions."""
         names = self._all_names_(name)
-        objs = self._objs_[typ]
 
-        for n in names:
+        # The name itself has already been looked up by __call__, so only the
+        # prefixed names need to be checked (if any).
+        objs = self._objs_[typ]
+        for n in names[1:]:
             if n in objs:
-                return self.objs[n]
+                return objs[n]
 
+        typ_defs = self._defs_[typ]
+        type_defs = self._defs_["types"]
+        # Structs, unions and enums may also be accessed through a typedef.
+        is_aliasable = typ in _ALIASABLE_KINDS
         for n in names:  # try with and without prefix
-            if n not in self._defs_[typ] and not (
-                typ in ["structs", "unions", "enums"] and n in self._defs_["types"]
-            ):
+            if n not in typ_defs and not (is_aliasable and n in type_defs):
                 continue
 
             if typ == "values":
-                return self._defs_[typ][n]
+                return typ_defs[n]
             elif typ == "functions":
                 return self._get_function(n)
             elif typ == "types":
-                obj = self._defs_[typ][n]
-                return self._get_type(obj)
+                return self._get_type(typ_defs[n])
             elif typ == "structs":
                 return self._get_struct("structs", n)
             elif typ == "unions":
@@ -332,7 +388,7 @@ class CLibrary(object, metaclass=CLibraryMeta):
         """Return a CFuntion instance."""
         try:
             func = getattr(self._lib_, func_name)
-        except Exception:
+        except AttributeError:
             mess = "Function name '{}' appears in headers but not in library!"
             raise KeyError(mess.format(func_name))
 
@@ -363,6 +419,29 @@ class CLibrary(object, metaclass=CLibraryMeta):
         """
         raise NotImplementedError()
 
+    def _get_type_cached(self, typ, pointers=True):
+        """Memoized version of _get_type.
+
+        Types containing unhashable declarators (arrays) are not cached. The
+        cache is cleared when the types of the parser change.
+
+        """
+        # Drop the cached types if typedefs were redefined in the parser.
+        revision = self._headers_.types_revision
+        if revision != self._type_cache_revision_:
+            self._type_cache_.clear()
+            self._type_cache_revision_ = revision
+
+        key = (tuple(typ), pointers)
+        try:
+            cls = self._type_cache_.get(key, _MISSING)
+        except TypeError:
+            return self._get_type(typ, pointers)
+
+        if cls is _MISSING:
+            cls = self._type_cache_[key] = self._get_type(typ, pointers)
+        return cls
+
     def _get_struct(self, str_type, str_name):
         """Return an object representing the named structure or union."""
         raise NotImplementedError()
@@ -396,26 +475,59 @@ class CLibrary(object, metaclass=CLibraryMeta):
 class CFunction(object):
     """Wrapper object for a function from the library."""
 
+    __slots__ = (
+        "arg_defaults",
+        "arg_eval_types",
+        "arg_inds",
+        "arg_names",
+        "arg_sigs",
+        "arg_types",
+        "func",
+        "lib",
+        "lock",
+        "lock_call",
+        "n_req_args",
+        "name",
+        "req_args",
+        "res_type",
+        "sig",
+    )
+
     def __init__(self, lib, func, sig, name, lock_call):
         self.lock_call = lock_call
         self.lib = lib
+        # Lock shared by all the functions of the library when calls are
+        # serialized.
+        self.lock = lib._lock_ if lock_call else None
         self.func = func
 
-        # looks like [return_type, [(argName, type, default),
-        #                           (argName, type, default), ...]]
-        self.sig = list(sig)
-
-        # remove void args from list
-        self.sig[1] = [s for s in sig[1] if s[1] != ("void",)]
-        for conv in ["__stdcall", "__cdecl"]:
-            if conv in self.sig[0]:
-                self.sig[0].remove(conv)
+        # looks like (return_type, ((argName, type, default),
+        #                           (argName, type, default), ...))
+        # with the calling convention removed from the return type and the
+        # void arguments removed from the arguments.
+        self.sig = [
+            _strip_call_conv(sig[0]),
+            [s for s in sig[1] if s[1] != ("void",)],
+        ]
         self.name = name
-        self.res_type = lib._get_type(self.sig[0])
-        self.arg_types = [lib._get_type(s[1]) for s in self.sig[1]]
-        self.req_args = [x[0] for x in self.sig[1] if x[2] is None]
+
+        # Names, types and default values of the arguments stored as parallel
+        # lists so that the call path only needs a single index operation.
+        self.arg_names = [s[0] for s in self.sig[1]]
+        self.arg_sigs = [s[1] for s in self.sig[1]]
+        self.arg_defaults = [s[2] for s in self.sig[1]]
+
+        self.res_type = lib._get_type_cached(self.sig[0])
+        self.arg_types = [lib._get_type_cached(s) for s in self.arg_sigs]
+        self.req_args = [
+            n for n, d in zip(self.arg_names, self.arg_defaults) if d is None
+        ]
+        self.n_req_args = len(self.req_args)
         # Mapping from argument names to indices
-        self.arg_inds = {s[0]: i for i, s in enumerate(self.sig[1])}
+        self.arg_inds = {n: i for i, n in enumerate(self.arg_names)}
+        # Fundamental types of the arguments, used to build missing arguments
+        # without evaluating the typedefs again on each call.
+        self.arg_eval_types = [lib._headers_.eval_type(s) for s in self.arg_sigs]
 
         self.lib._init_function(self)
 
@@ -431,78 +543,68 @@ class CFunction(object):
         arguments (so that objects passed by reference can be retrieved).
 
         """
+        null = self.lib.Null
+
         # We'll need at least this many arguments.
-        arg_list = [None] * max(len(self.req_args), len(args))
+        arg_list = [None] * max(self.n_req_args, len(args))
 
         # First fill in args
-        for i in range(len(args)):
-            if args[i] is None:
-                arg_list[i] = self.lib.Null
-            else:
-                arg_list[i] = args[i]
+        for i, arg in enumerate(args):
+            arg_list[i] = null if arg is None else arg
 
         # Next fill in kwargs
-        for k in kwargs:
-            if k not in self.arg_inds:
+        for k, arg in kwargs.items():
+            ind = self.arg_inds.get(k)
+            if ind is None:
                 mess = "Function signature has no argument named '{}'"
                 raise TypeError(mess.format(k))
 
-            ind = self.arg_inds[k]
             # Stretch argument list if needed
-            if ind >= len(arg_list):  #
+            if ind >= len(arg_list):
                 arg_list += [None] * (ind - len(arg_list) + 1)
-            if kwargs[k] is None:
-                arg_list[ind] = self.lib.Null
-            else:
-                arg_list[ind] = kwargs[k]
+            arg_list[ind] = null if arg is None else arg
 
         guessed_args = []
         # Finally, fill in remaining arguments if they are pointers to
         # int/float/void*/struct values (we assume these are to be modified by
         # the function and their initial value is not important)
-        missings = {
-            i: arg
-            for i, arg in enumerate(arg_list)
-            if arg is None or arg is self.lib.Null
-        }
-        for i, arg in missings.items():
-            try:
-                sig = self.sig[1][i][1]
-                arg_type = self.lib._headers_.eval_type(sig)
-
-                # request to build a null pointer
-                if arg is self.lib.Null:
-                    if len(arg_type) < 2:
-                        mess = make_mess("""Cannot create NULL for
-                                        non-pointer argument type: {}""")
-                        raise TypeError(mess.format(arg_type))
-                    arg_list[i] = self.lib._get_type(sig)()
-
-                else:
-                    arg_list[i] = self.lib._get_pointer(arg_type, sig)
-                    guessed_args.append(i)
-
-            except Exception:
-                if sys.exc_info()[0] is not AssertionError:
-                    raise
-                mess = "Function call '{}' missing required argument {} {}"
-                raise TypeError(mess.format(self.name, i, self.sig[1][i][0]))
+        for i, arg in enumerate(arg_list):
+            if arg is not None and arg is not null:
+                continue
+
+            arg_type = self.arg_eval_types[i]
+
+            # request to build a null pointer
+            if arg is null:
+                if len(arg_type) < 2:
+                    mess = make_mess("""Cannot create NULL for
+                                    non-pointer argument type: {}""")
+                    raise TypeError(mess.format(arg_type))
+                arg_list[i] = self.arg_types[i]()
+
+            else:
+                try:
+                    arg_list[i] = self.lib._get_pointer(arg_type, self.arg_sigs[i])
+                except AssertionError:
+                    mess = "Function call '{}' missing required argument {} {}"
+                    raise TypeError(mess.format(self.name, i, self.arg_names[i]))
+                guessed_args.append(i)
 
         try:
             if self.lock_call:
-                with self.lib.lock:
+                with self.lock:
                     res = self.func(*arg_list)
             else:
                 res = self.func(*arg_list)
         except Exception:
             logger.error(
-                "Function call failed. Signature is: {}".format(self.pretty_signature())
+                "Function call failed. Signature is: %s", self.pretty_signature()
             )
-            logger.error("Arguments: {}".format(arg_list))
-            logger.error("Argtypes: {}".format(self.func.argtypes))
+            logger.error("Arguments: %s", arg_list)
+            logger.error("Argtypes: %s", self.func.argtypes)
             raise
 
-        cr = CallResult(self.lib, res, arg_list, self.sig, guessed=guessed_args)
+        cr = CallResult(self.lib, res, arg_list, self.sig, guessed_args, self.arg_inds)
         return cr
 
     def arg_c_type(self, arg):
@@ -516,13 +618,15 @@ class CFunction(object):
         """
         if isinstance(arg, str):
             arg = self.arg_inds[arg]
-        return self.lib._get_type(self.sig[1][arg][1])
+        return self.arg_types[arg]
 
     def pretty_signature(self):
         args = (
             "".join(self.sig[0]),
             self.name,
-            ", ".join(["{} {}".format(s[1], s[0]) for s in self.sig[1]]),
+            ", ".join(
+                ["{} {}".format(t, n) for n, t in zip(self.arg_names, self.arg_sigs)]
+            ),
         )
         return "{} {}({})".format(*args)
 
@@ -566,14 +670,23 @@ class CallResult(object):
     guessed : tuple
         Pointers that were created on the fly.
 
+    arg_inds : dict, optional
+        Mapping between the arguments names and their indices. Built from the
+        signature if not provided.
+
     """
 
-    def __init__(self, lib, rval, args, sig, guessed):
+    __slots__ = ("arg_inds", "args", "guessed", "lib", "rval", "sig")
+
+    def __init__(self, lib, rval, args, sig, guessed, arg_inds=None):
         self.lib = lib
         self.rval = rval  # return value of function call
         self.args = args  # list of arguments to function call
         self.sig = sig  # function signature
         self.guessed = guessed  # list of arguments that were auto-generated
+        if arg_inds is None:
+            arg_inds = {a[0]: i for i, a in enumerate(sig[1])}
+        self.arg_inds = arg_inds
 
     def __call__(self):
         if self.sig[0] == ["void"]:
@@ -605,16 +718,16 @@ class CallResult(object):
 
     def find_arg(self, arg):
         """Find argument based on name."""
-        for i, a in enumerate(self.sig[1]):
-            if a[0] == arg:
-                return i
+        ind = self.arg_inds.get(arg)
+        if ind is not None:
+            return ind
         mess = make_mess("""Can't find argument '{}' in function signature.
                          Arguments are: {}""")
         raise KeyError(mess.format(arg, str([a[0] for a in self.sig[1]])))
 
     def __iter__(self):
         yield self()
-        yield (self[i] for i in range(len(self.args)))
+        yield tuple(self[i] for i in range(len(self.args)))
 
     def auto(self):
         """Return a list of all the auto-generated values.
@@ -625,6 +738,23 @@ class CallResult(object):
         return [self[n] for n in self.guessed]
 
 
+def _strip_call_conv(typ):
+    """Remove the calling convention modifiers from a type."""
+    kept = [
+        i
+        for i, t in enumerate(typ)
+        if not (isinstance(t, str) and t in _CALL_CONVENTIONS)
+    ]
+    if len(kept) == len(typ):
+        return typ
+    if isinstance(typ, Type):
+        return Type(
+            *[typ[i] for i in kept],
+            type_quals=tuple(typ.type_quals[i] for i in kept),
+        )
+    return type(typ)(typ[i] for i in kept)
+
+
 def cast_to(lib, obj, typ):
     """Cast obj to a new type.
 
@@ -13,9 +13,15 @@ function signatures from C header files.
 
 import logging
 import os
+import pickle
 import re
 import sys
+from bisect import bisect_right
+from functools import lru_cache
 from inspect import cleandoc
+from operator import itemgetter
+from pprint import pformat
+from string import Formatter
 from traceback import format_exc
 
 # Import parsing elements
@@ -38,27 +44,39 @@ from pyparsing import (
     ZeroOrMore,
     alphanums,
     alphas,
-    cStyleComment,
     delimitedList,
     hexnums,
     lineno,
     nestedExpr,
     oneOf,
     quotedString,
-    restOfLine,
 )
 
 from .errors import DefinitionError
 from .utils import find_header
 
-ParserElement.enablePackrat()
-
 logger = logging.getLogger(__name__)
 
 
 __all__ = ["CParser", "win_defs"]
 
 
+#: Shared empty qualifiers per number of declarator levels, used by Type
+#: instances created without explicit qualifiers.
+_default_quals = {}
+
+#: Regex matching the signed keyword, which is dropped from evaluated types.
+_signed_regex = re.compile(r"\bsigned\b")
+
+#: Qualifier tuples already seen by the parser, used to share equal tuples.
+_quals_cache = {}
+
+
+def _intern_quals(quals):
+    """Return the shared tuple equal to quals."""
+    return _quals_cache.setdefault(quals, quals)
+
+
 class Type(tuple):
     """
     Representation of a C type. CParser uses this class to store the parsed
@@ -114,24 +132,31 @@ class Type(tuple):
     """
 
     # Cannot slot a subclass of tuple.
-    def __new__(cls, type_spec, *declarators, **argv):
+    def __new__(cls, type_spec, *declarators, type_quals=None):
         return super(Type, cls).__new__(cls, (type_spec, *declarators))
 
-    def __init__(self, type_spec, *declarators, **argv):
+    def __init__(self, type_spec, *declarators, type_quals=None):
         super(Type, self).__init__()
-        self.type_quals = argv.pop("type_quals", None) or ((),) * (1 + len(declarators))
-        if len(self.type_quals) != 1 + len(declarators):
+        if not type_quals:
+            n = 1 + len(declarators)
+            type_quals = _default_quals.get(n)
+            if type_quals is None:
+                type_quals = _default_quals.setdefault(n, ((),) * n)
+        elif len(type_quals) != 1 + len(declarators):
             raise ValueError("wrong number of type qualifiers")
-        assert len(argv) == 0, "Invalid Parameter"
+        self.type_quals = type_quals
 
     def __eq__(self, other):
+        if self is other:
+            return True
         if isinstance(other, Type):
             if self.type_quals != other.type_quals:
                 return False
-        return super(Type, self).__eq__(other)
+        return tuple.__eq__(self, other)
 
     def __ne__(self, other):
-        return not self.__eq__(other)
+        eq = self.__eq__(other)
+        return eq if eq is NotImplemented else not eq
 
     @property
     def declarators(self):
@@ -149,25 +174,19 @@ class Type(tuple):
 
         """
 
-        if (
-            self[0].startswith("struct ")
-            or self[0].startswith("union ")
-            or self[0].startswith("enum ")
-        ):
+        if self[0].startswith(("struct ", "union ", "enum ")):
             return True
 
-        names = (
-            num_types + nonnum_types + size_modifiers + sign_modifiers + extra_type_list
-        )
         for w in self[0].split():
-            if w not in names:
+            if w not in fund_type_words:
                 return False
         return True
 
     def eval(self, type_map, used=None):
         """Resolves the type_spec of this type recursively if it is referring
         to a typedef. For resolving the type type_map is used for lookup.
-        Returns a new Type object.
+        Returns a new Type object, or this one when it is already fully
+        evaluated.
 
         Parameters
         ----------
@@ -181,37 +200,49 @@ class Type(tuple):
         """
         used = used or []
 
-        if self.is_fund_type():
-            # Remove 'signed' before returning evaluated type
-            return Type(
-                re.sub(r"\bsigned\b", "", self.type_spec).strip(),
-                *self.declarators,
-                type_quals=self.type_quals,
-            )
+        # Follow the typedef chain iteratively rather than recursing.
+        typ = self
+        while not typ.is_fund_type():
+            parent = typ.type_spec
+            if parent in used:
+                m = "Recursive loop while evaluating types. (typedefs are {})"
+                raise DefinitionError(m.format(" -> ".join([*used, parent])))
+
+            used.append(parent)
+            if parent not in type_map:
+                m = 'Unknown type "{}" (typedefs are {})'
+                raise DefinitionError(m.format(parent, " -> ".join(used)))
+
+            typ = typ._on_base(type_map[parent])
 
-        parent = self.type_spec
-        if parent in used:
-            m = "Recursive loop while evaluating types. (typedefs are {})"
-            raise DefinitionError(m.format(" -> ".join([*used, parent])))
+        # Remove 'signed' before returning evaluated type
+        spec = typ.type_spec
+        if "signed" in spec:
+            spec = _signed_regex.sub("", spec)
+        spec = spec.strip()
+        if spec == typ.type_spec:
+            return typ
+        return Type(spec, *typ.declarators, type_quals=typ.type_quals)
 
-        used.append(parent)
-        if parent not in type_map:
-            m = 'Unknown type "{}" (typedefs are {})'
-            raise DefinitionError(m.format(parent, " -> ".join(used)))
+    def _on_base(self, base):
+        """Return a new Type applying the declarators of this type to base.
 
-        pt = type_map[parent]
-        evaled_type = Type(
-            pt.type_spec,
-            *(pt.declarators + self.declarators),
+        The qualifiers of this type_spec are merged with the ones of the last
+        declarator level of base.
+
+        """
+        quals = base.type_quals
+        return Type(
+            base[0],
+            *base[1:],
+            *self[1:],
             type_quals=(
-                pt.type_quals[:-1]
-                + (pt.type_quals[-1] + self.type_quals[0],)
-                + self.type_quals[1:]
+                *quals[:-1],
+                quals[-1] + self.type_quals[0],
+                *self.type_quals[1:],
             ),
         )
 
-        return evaled_type.eval(type_map, used)
-
     def add_compatibility_hack(self):
         """If This Type is refering to a function (**not** a function pointer)
         a new type is returned, that matches the hack from version 0.1.0.
@@ -244,12 +275,12 @@ class Type(tuple):
             return self
 
     def __repr__(self):
-        type_qual_str = (
-            "" if not any(self.type_quals) else ", type_quals=" + repr(self.type_quals)
-        )
-        return (
-            type(self).__name__ + "(" + ", ".join(map(repr, self)) + type_qual_str + ")"
-        )
+        args = ", ".join(map(repr, self))
+        if any(self.type_quals):
+            return "{}({}, type_quals={!r})".format(
+                type(self).__name__, args, self.type_quals
+            )
+        return "{}({})".format(type(self).__name__, args)
 
     def __getnewargs__(self):
         return (self.type_spec, *self.declarators)
@@ -268,14 +299,10 @@ class Compound(dict):
         super(Compound, self).__init__({"members": members, "pack": pack})
 
     def __repr__(self):
-        packParam = ", pack=" + repr(self.pack) if self.pack is not None else ""
-        return (
-            type(self).__name__
-            + "("
-            + ", ".join(map(repr, self.members))
-            + packParam
-            + ")"
-        )
+        args = list(map(repr, self.members))
+        if self.pack is not None:
+            args.append("pack=" + repr(self.pack))
+        return "{}({})".format(type(self).__name__, ", ".join(args))
 
     @property
     def members(self):
@@ -328,7 +355,7 @@ class Enum(dict):
         return (
             type(self).__name__
             + "("
-            + ", ".join(nm + "=" + repr(val) for nm, val in sorted(self.items()))
+            + ", ".join(map("{0[0]}={0[1]!r}".format, sorted(self.items())))
             + ")"
         )
 
@@ -448,6 +475,9 @@ class CParser(object):
     >>> all_values = p.defs['values']
     >>> functionSignatures = p.defs['functions']
 
+    The definitions should be treated as read-only, use add_def and rem_def to
+    change them so that the cached typedef resolutions are invalidated.
+
     To see what was not successfully parsed
 
     >>> unp = p.process_all(return_unparsed=True)
@@ -459,7 +489,8 @@ class CParser(object):
     #: Increment every time cache structure or parsing changes to invalidate
     #: old cache files.
     # 2 : add C99 integers
-    cache_version = 2
+    # 3 : escape literal braces in function macro bodies
+    cache_version = 3
 
     #: Private flag allowing to know if the parser has been initiliased.
     _init = False
@@ -521,13 +552,16 @@ class CParser(object):
 
         # Holds translations from typedefs/structs/unions to fundamental types
         self.compiled_types = {}
+        # Incremented each time the types change so that caches built on top
+        # of the parser (such as CLibrary ones) can detect it.
+        self.types_revision = 0
 
         self.current_file = None
 
         # Import extra arguments if specified
-        for t in kwargs:
-            for k in kwargs[t].keys():
-                self.add_def(t, k, kwargs[t][k])
+        for typ, defs in kwargs.items():
+            for name, val in defs.items():
+                self.add_def(typ, name, val)
 
         # Import from other CParsers if specified
         if copy_from is not None:
@@ -654,9 +688,8 @@ class CParser(object):
 
         try:
             # Read cache file
-            import pickle
-
-            cache = pickle.load(open(cache_file, "rb"))
+            with open(cache_file, "rb") as f:
+                cache = pickle.loads(f.read())
 
             # Make sure __init__ options match
             if check_validity:
@@ -692,11 +725,19 @@ class CParser(object):
         Used internally; does not need to be called manually.
 
         """
-        for f in data.keys():
+        for f, f_defs in data.items():
             self.current_file = f
+            if not any(f_defs[k] for k in self.data_list):
+                continue
+            base_name = None if f is None else os.path.basename(f)
+            if base_name not in self.file_defs:
+                self.file_defs[base_name] = {k: {} for k in self.data_list}
+            file_defs = self.file_defs[base_name]
+            # Merge each kind of definitions at once rather than one by one.
             for k in self.data_list:
-                for n in data[f][k]:
-                    self.add_def(k, n, data[f][k][n])
+                self.defs[k].update(f_defs[k])
+                file_defs[k].update(f_defs[k])
+        self._clear_compiled_types()
 
     def write_cache(self, cache_file):
         """Store all parsed declarations to cache. Used internally."""
@@ -704,10 +745,9 @@ class CParser(object):
         cache["opts"] = self.init_opts
         cache["file_defs"] = self.file_defs
         cache["version"] = self.cache_version
-        import pickle
 
         with open(cache_file, "wb") as f:
-            pickle.dump(cache, f)
+            pickle.dump(cache, f, pickle.HIGHEST_PROTOCOL)
 
     def find_headers(self, headers):
         """Try to find the specified headers."""
@@ -753,11 +793,15 @@ class CParser(object):
             return False
 
         with open(path, "r", encoding=encoding) as fd:
-            self.files[path] = fd.read()
+            text = fd.read()
 
+        # Replacements are applied in order, each one seeing the result of
+        # the previous ones.
         if replace is not None:
-            for s in replace:
-                self.files[path] = re.sub(s, replace[s], self.files[path])
+            for pattern, repl in replace.items():
+                text = re.sub(pattern, repl, text)
+
+        self.files[path] = text
 
         self.file_order.append(path)
         bn = os.path.basename(path)
@@ -768,16 +812,15 @@ class CParser(object):
         return True
 
     def _format_parsed_file(self, filename=None):
-        from pprint import pformat
-
-        s = ""
+        parts = []
         for k in self.data_list:
-            s += "============== {} ==================\n".format(k)
+            parts.append("============== {} ==================\n".format(k))
             if filename is None:
-                s += pformat(self.defs[k], indent=4) + "\n"
+                parts.append(pformat(self.defs[k], indent=4))
             else:
-                s += pformat(self.file_defs[filename][k]) + "\n"
-        return s
+                parts.append(pformat(self.file_defs[filename][k]))
+            parts.append("\n")
+        return "".join(parts)
 
     def print_all(self, filename=None):
         """Print everything parsed from files. Useful for debugging.
@@ -803,13 +846,7 @@ class CParser(object):
         Operates in memory, does not alter the original files.
 
         """
-        text = self.files[path]
-        cplusplus_line_comment = Literal("//") + restOfLine
-        # match quoted strings first to prevent matching comments inside quotes
-        comment_remover = (
-            quotedString | cStyleComment.suppress() | cplusplus_line_comment.suppress()
-        )
-        self.files[path] = comment_remover.transformString(text)
+        self.files[path] = _comment_regex.sub(_keep_string, self.files[path])
 
     # --- Pre processing
 
@@ -835,32 +872,28 @@ class CParser(object):
         self.pack_list[path] = [(0, None)]
         packing = None  # Current packing value
 
-        text = self.files[path]
-
-        # First join together lines split by \\n
-        text = Literal("\\\n").suppress().transformString(text)
-
-        # Define the structure of a macro definition
-        name = Word(alphas + "_", alphanums + "_")("name")
-        deli_list = Optional(lparen + delimitedList(name) + rparen)
-        self.pp_define = (
-            name.setWhitespaceChars(" \t")("macro")
-            + deli_list.setWhitespaceChars(" \t")("args")
-            + SkipTo(LineEnd())("value")
-        )
-        self.pp_define.setParseAction(self.process_macro_defn)
+        # First join together lines split by \\n, then split the text only once
+        lines = self.files[path].replace("\\\n", "").split("\n")
 
-        # Comb through lines, process all directives
-        lines = text.split("\n")
+        def is_defined(m):
+            name = m.group("paren") or m.group("name")
+            is_macro = name in self.defs["macros"] or name in self.defs["fnmacros"]
+            return "1" if is_macro else "0"
 
-        result = []
+        # Directives and inactive lines are blanked rather than dropped so that
+        # line numbers keep matching the ones recorded for packings.
+        result = [""] * len(lines)
 
-        directive = re.compile(r"\s*#\s*([a-zA-Z]+)(.*)$")
+        # A branch is only ever marked as taken when all the enclosing ones
+        # are, so the last entry of if_true tells whether the current line is
+        # live without walking the whole stack.
         if_true = [True]
         if_hit = []
+        # Comb through lines, process all directives
         for i, line in enumerate(lines):
             new_line = ""
-            m = directive.match(line)
+            # Most lines are code, rule them out before running the regex.
+            m = _directive_regex.match(line) if "#" in line else None
 
             # Regular code line
             if m is None:
@@ -871,8 +904,8 @@ class CParser(object):
 
             # Macro line
             else:
-                d = m.groups()[0]
-                rest = m.groups()[1]
+                d = m.group(1)
+                rest = m.group(2)
 
                 if d == "ifdef":
                     d = "if"
@@ -883,28 +916,17 @@ class CParser(object):
 
                 # Evaluate 'defined' operator before expanding macros
                 if d in ["if", "elif"]:
-
-                    def pa(t):
-                        is_macro = t["name"] in self.defs["macros"]
-                        is_macro_func = t["name"] in self.defs["fnmacros"]
-                        return ["0", "1"][is_macro or is_macro_func]
-
-                    rest = (
-                        (Keyword("defined") + (name | lparen + name + rparen))
-                        .setParseAction(pa)
-                        .transformString(rest)
-                    )
+                    rest = _defined_regex.sub(is_defined, rest)
 
                 elif d in ["define", "undef"]:
-                    match = re.match(r"\s*([a-zA-Z_][a-zA-Z0-9_]*)(.*)$", rest)
-                    macroName, rest = match.groups()
+                    macroName, rest = _macro_name_regex.match(rest).groups()
 
                 # Expand macros if needed
-                if rest is not None and (all(if_true) or d in ["if", "elif"]):
+                if rest is not None and (if_true[-1] or d in ["if", "elif"]):
                     rest = self.expand_macros(rest)
 
                 if d == "elif":
-                    if if_hit[-1] or not all(if_true[:-1]):
+                    if if_hit[-1] or not if_true[-2]:
                         ev = False
                     else:
                         ev = self.eval_preprocessor_expr(rest)
@@ -920,7 +942,7 @@ class CParser(object):
                     logger.debug(
                         "  " * (len(if_true) - 2) + line + "{}".format(not if_hit[-1])
                     )
-                    if_true[-1] = (not if_hit[-1]) and all(if_true[:-1])
+                    if_true[-1] = (not if_hit[-1]) and if_true[-2]
                     if_hit[-1] = True
 
                 elif d == "endif":
@@ -929,7 +951,7 @@ class CParser(object):
                     logger.debug("  " * (len(if_true) - 1) + line)
 
                 elif d == "if":
-                    if all(if_true):
+                    if if_true[-1]:
                         ev = self.eval_preprocessor_expr(rest)
                     else:
                         ev = False
@@ -949,7 +971,9 @@ class CParser(object):
                     )
                     try:
                         # Macro is registered here
-                        self.pp_define.parseString(macroName + " " + rest)
+                        self.process_macro_defn(
+                            pp_define.parseString(macroName + " " + rest)
+                        )
                     except Exception:
                         logger.exception(
                             "Error processing macro definition:"
@@ -977,11 +1001,10 @@ class CParser(object):
                 elif d == "pragma":
                     if not if_true[-1]:
                         continue
-                    m = re.match(r"\s+pack\s*\(([^\)]*)\)", rest)
+                    m = _pragma_pack_regex.match(rest)
                     if not m:
                         continue
-                    if m.groups():
-                        opts = [s.strip() for s in m.groups()[0].split(",")]
+                    opts = [s.strip() for s in m.group(1).split(",")]
 
                     pushpop = id = val = None
                     for o in opts:
@@ -992,6 +1015,16 @@ class CParser(object):
                         else:
                             id = o
 
+                    # Like compilers, ignore packings which are not a power of 2,
+                    # any push or pop is still applied to keep the stack balanced.
+                    if val is not None and (val == 0 or val & (val - 1)):
+                        logger.warning(
+                            "Ignored invalid packing value %s at line %s", val, i
+                        )
+                        if pushpop is None:
+                            continue
+                        val = None
+
                     packing = val
 
                     if pushpop == "push":
@@ -1000,13 +1033,11 @@ class CParser(object):
                         if id is None:
                             pack_stack.pop()
                         else:
-                            ind = None
-                            for j, s in enumerate(pack_stack):
-                                if s[1] == id:
-                                    ind = j
+                            # Pop up to the most recent record with this id.
+                            for j in range(len(pack_stack) - 1, 0, -1):
+                                if pack_stack[j][1] == id:
+                                    del pack_stack[j:]
                                     break
-                            if ind is not None:
-                                pack_stack = pack_stack[:ind]
                         if val is None:
                             packing = pack_stack[-1][0]
 
@@ -1018,73 +1049,53 @@ class CParser(object):
                     mess = "Ignored directive {} at line {}"
                     logger.debug(mess.format(d, i))
 
-            result.append(new_line)
+            result[i] = new_line
         self.files[path] = "\n".join(result)
 
     def eval_preprocessor_expr(self, expr):
-        # Make a few alterations so the expression can be eval'd
-        macro_diffs = (
-            Literal("!").setParseAction(lambda: " not ")
-            | Literal("&&").setParseAction(lambda: " and ")
-            | Literal("||").setParseAction(lambda: " or ")
-            | Word(alphas + "_", alphanums + "_").setParseAction(lambda: "0")
-        )
-        expr2 = macro_diffs.transformString(expr).strip()
-
-        try:
-            ev = bool(eval(expr2))
-        except Exception:
-            mess = "Error evaluating preprocessor expression: {} [{}]\n{}"
-            logger.debug(mess.format(expr, repr(expr2), format_exc()))
-            ev = False
-        return ev
+        return _eval_preprocessor_expr(expr)
 
     def process_macro_defn(self, t):
         """Parse a #define macro and register the definition."""
-        logger.debug("Processing MACRO: {}".format(t))
+        # Formatting the parse results is costly, let logging do it only when
+        # the message is actually emitted.
+        logger.debug("Processing MACRO: %s", t)
+        name = t.macro
         macro_val = t.value.strip()
-        if macro_val in self.defs["fnmacros"]:
-            self.add_def("fnmacros", t.macro, self.defs["fnmacros"][macro_val])
-            logger.debug("  Copy fn macro {} => {}".format(macro_val, t.macro))
+        fnmacro = self.defs["fnmacros"].get(macro_val)
+        if fnmacro is not None:
+            self.add_def("fnmacros", name, fnmacro)
+            logger.debug("  Copy fn macro %s => %s", macro_val, name)
 
         else:
-            if t.args == "":
+            args = t.args
+            if args == "":
                 val = self.eval_expr(macro_val)
-                self.add_def("macros", t.macro, macro_val)
-                self.add_def("values", t.macro, val)
-                mess = "  Add macro: {} ({}); {}"
-                logger.debug(mess.format(t.macro, val, self.defs["macros"][t.macro]))
+                self.add_def("macros", name, macro_val)
+                self.add_def("values", name, val)
+                logger.debug("  Add macro: %s (%s); %s", name, val, macro_val)
 
             else:
-                self.add_def(
-                    "fnmacros",
-                    t.macro,
-                    self.compile_fn_macro(macro_val, list(t.args)),
-                )
-                mess = "  Add fn macro: {} ({}); {}"
-                logger.debug(
-                    mess.format(t.macro, t.args, self.defs["fnmacros"][t.macro])
-                )
+                fnmacro = self.compile_fn_macro(macro_val, list(args))
+                self.add_def("fnmacros", name, fnmacro)
+                logger.debug("  Add fn macro: %s (%s); %s", name, args, fnmacro)
 
-        return "#define " + t.macro + " " + macro_val
+        return "#define " + name + " " + macro_val
 
     def compile_fn_macro(self, text, args):
         """Turn a function macro spec into a compiled description."""
         # Find all instances of each arg in text.
-        args_str = "|".join(args)
-        arg_regex = re.compile(r'("(\\"|[^"])*")|(\b({})\b)'.format(args_str))
+        arg_regex = _fn_macro_arg_regex(tuple(args))
         start = 0
         parts = []
         arg_order = []
-        # The group number to check for macro names
-        N = 3
         for m in arg_regex.finditer(text):
-            arg = m.groups()[N]
+            arg = m.group("arg")
             if arg is not None:
-                parts.append(text[start : m.start(N)] + "{}")
-                start = m.end(N)
+                parts.append(_escape_braces(text[start : m.start("arg")]) + "{}")
+                start = m.end("arg")
                 arg_order.append(args.index(arg))
-        parts.append(text[start:])
+        parts.append(_escape_braces(text[start:]))
         return ("".join(parts), arg_order)
 
     def expand_macros(self, line):
@@ -1093,42 +1104,44 @@ class CParser(object):
         Faulty calls to macro function are left untouched.
 
         """
-        reg = re.compile(r'("(\\"|[^"])*")|(\b(\w+)\b)')
+        reg = _identifier_regex
         parts = []
-        # The group number to check for macro names
-        N = 3
         macros = self.defs["macros"]
         fnmacros = self.defs["fnmacros"]
+        # Scan the line from the current position instead of slicing off the
+        # part already processed.
+        pos = 0
         while True:
-            m = reg.search(line)
+            m = reg.search(line, pos)
             if not m:
                 break
-            name = m.groups()[N]
+            name = m.group("name")
             if name in macros:
-                parts.append(line[: m.start(N)])
-                line = line[m.end(N) :]
+                parts.append(line[pos : m.start("name")])
                 parts.append(macros[name])
+                pos = m.end("name")
 
             elif name in fnmacros:
+                tail = line[m.end("name") :]
                 # If function macro expansion fails, just ignore it.
                 try:
-                    exp, end = self.expand_fn_macro(name, line[m.end(N) :])
+                    exp, end = self.expand_fn_macro(name, tail)
                 except Exception:
                     exp = name
-                    end = line[m.end(N) :]
+                    end = tail
                     mess = "Function macro expansion failed: {}, {}\n {}"
-                    logger.error(mess.format(name, line[m.end(N) :], format_exc()))
+                    logger.error(mess.format(name, tail, format_exc()))
 
-                parts.append(line[: m.start(N)])
-                line = end
+                parts.append(line[pos : m.start("name")])
                 parts.append(exp)
+                # The unconsumed text is always a suffix of the line.
+                pos = len(line) - len(end)
 
             else:
-                start = m.end(N)
-                parts.append(line[:start])
-                line = line[start:]
+                parts.append(line[pos : m.end()])
+                pos = m.end()
 
-        parts.append(line)
+        parts.append(line[pos:])
         return "".join(parts)
 
     def expand_fn_macro(self, name, text):
@@ -1137,17 +1150,23 @@ class CParser(object):
         defn = self.defs["fnmacros"][name]
 
         try:
-            args, end = text.split(")", 1)
-            _, args = args.split("(", 1)
-            args = [a.strip() for a in args.split(",")]
+            args, end = _split_macro_args(text)
         except Exception:
             mess = "Function macro {} argument analysis failed :\n{}"
             raise DefinitionError(0, mess.format(name, format_exc()))
 
-        args = [self.expand_macros(arg) for arg in args]
-        new_str = defn[0].format(*[args[i] for i in defn[1]])
+        # Only expand the arguments the body refers to, each one once.
+        expanded = {}
+        literals = _fn_macro_literals(defn[0])
+        parts = [literals[0]]
+        for i, literal in zip(defn[1], literals[1:]):
+            arg = expanded.get(i)
+            if arg is None:
+                arg = expanded[i] = self.expand_macros(args[i])
+            parts.append(arg)
+            parts.append(literal)
 
-        return (new_str, end)
+        return ("".join(parts), end)
 
     # --- Compilation functions
 
@@ -1407,13 +1426,14 @@ class CParser(object):
             if decl["args"][0] is None:
                 toks.append(())
             else:
-                ex = lambda x: (x[0],) if len(x) != 0 else (None,)  # noqa
+                # Each argument is (name, type, default value or None).
                 toks.append(
                     tuple(
-                        [
-                            self.process_type(a["type"], a["decl"][0]) + ex(a["val"])
-                            for a in decl["args"]
-                        ]
+                        (
+                            *self.process_type(a["type"], a["decl"][0]),
+                            a["val"][0] if len(a["val"]) != 0 else None,
+                        )
+                        for a in decl["args"]
                     )
                 )
             quals.append(())
@@ -1464,9 +1484,11 @@ class CParser(object):
         logger.debug("PROCESS TYPE/DECL: {}/{}".format(typ["name"], decl))
         (name, decl, quals) = self.process_declarator(decl)
         pre_typequal = tuple(typ.get("pre_qual", []))
+        # Share identical qualifiers between all the parsed types.
+        type_quals = tuple(map(_intern_quals, (pre_typequal + quals[0], *quals[1:])))
         return (
             name,
-            Type(typ["name"], *decl, type_quals=(pre_typequal + quals[0],) + quals[1:]),
+            Type(typ["name"], *decl, type_quals=_intern_quals(type_quals)),
         )
 
     def process_enum(self, s, line, t):
@@ -1523,13 +1545,10 @@ class CParser(object):
 
     def packing_at(self, line):
         """Return the structure packing value at the given line number."""
-        packing = None
-        for p in self.pack_list[self.current_file]:
-            if p[0] <= line:
-                packing = p[1]
-            else:
-                break
-        return packing
+        pack_list = self.pack_list[self.current_file]
+        # The packing changes are recorded in increasing line order.
+        i = bisect_right(pack_list, line, key=itemgetter(0))
+        return pack_list[i - 1][1] if i else None
 
     def process_struct(self, s, line, t):
         """ """
@@ -1665,6 +1684,8 @@ class CParser(object):
 
         """
         self.defs[typ][name] = val
+        if typ == "types":
+            self._clear_compiled_types()
         if self.current_file is None:
             base_name = None
         else:
@@ -1685,8 +1706,15 @@ class CParser(object):
         else:
             base_name = os.path.basename(self.current_file)
         del self.defs[typ][name]
+        if typ == "types":
+            self._clear_compiled_types()
         del self.file_defs[base_name][typ][name]
 
+    def _clear_compiled_types(self):
+        """Discard the typedef resolutions after the types changed."""
+        self.compiled_types.clear()
+        self.types_revision += 1
+
     def is_fund_type(self, typ):
         """Return True if this type is a fundamental C type, struct, or
         union.
@@ -1703,24 +1731,38 @@ class CParser(object):
         **ATTENTION: This function is legacy and should be replaced by
         Type.eval()**
 
+        Typedef resolutions are cached and the cache is only cleared by
+        add_def, rem_def and import_dict. Changing defs['types'] directly
+        leaves stale results.
+
         """
         if not isinstance(typ, Type):
             typ = Type(*typ)
-        return typ.eval(self.defs["types"])
+        if typ.is_fund_type():
+            return typ.eval(self.defs["types"])
+
+        # Resolve each typedef once and graft the declarators on top.
+        name = typ.type_spec
+        base = self.compiled_types.get(name)
+        if base is None:
+            base = Type(name).eval(self.defs["types"])
+            self.compiled_types[name] = base
+        return typ._on_base(base)
 
     def find(self, name):
         """Search all definitions for the given name."""
         res = []
-        for f in self.file_defs:
-            fd = self.file_defs[f]
-            for t in fd:
-                typ = fd[t]
-                for k in typ:
-                    if isinstance(name, str):
-                        if k == name:
-                            res.append((f, t))
-                    else:
-                        if re.match(name, k):
+        if isinstance(name, str):
+            for f, fd in self.file_defs.items():
+                for t, typ in fd.items():
+                    if name in typ:
+                        res.append((f, t))
+        else:
+            match = re.compile(name).match
+            for f, fd in self.file_defs.items():
+                for t, typ in fd.items():
+                    for k in typ:
+                        if match(k):
                             res.append((f, t, k))
         return res
 
@@ -1743,11 +1785,18 @@ def kwl(strs):
     return Regex(r"\b({})\b".format("|".join(strs)))
 
 
-def flatten(lst):
-    res = []
+def flatten(lst, res=None):
+    """Flatten nested lists/tuples into a single list of strings.
+
+    All the nested levels append to the same list instead of building and
+    extending an intermediate list per level.
+
+    """
+    if res is None:
+        res = []
     for i in lst:
         if isinstance(i, (list, tuple)):
-            res.extend(flatten(i))
+            flatten(i, res)
         else:
             res.append(str(i))
     return res
@@ -1758,6 +1807,147 @@ def recombine(tok):
     return " ".join(flatten(tok.asList()))
 
 
+#: Regex matching C and C++ comments. Quoted strings are matched first so
+#: that comment markers inside them are left untouched.
+_comment_regex = re.compile(
+    r"""("(?:[^"\n\r\\]|\\.)*"|'(?:[^'\n\r\\]|\\.)*')|/\*.*?\*/|//[^\n]*""",
+    re.DOTALL,
+)
+
+
+def _keep_string(match):
+    """Replacement function of _comment_regex dropping only the comments."""
+    return match.group(1) or ""
+
+
+#: Regex matching preprocessor directives, capturing the name and the rest.
+_directive_regex = re.compile(r"\s*#\s*([a-zA-Z]+)(.*)$")
+
+#: Regex splitting the name of a #define or #undef from the rest of the line.
+_macro_name_regex = re.compile(r"\s*([a-zA-Z_][a-zA-Z0-9_]*)(.*)$")
+
+#: Regex matching the options of a #pragma pack.
+_pragma_pack_regex = re.compile(r"\s+pack\s*\(([^\)]*)\)")
+
+#: Regex matching the defined operator in both its forms.
+_defined_regex = re.compile(
+    r"\bdefined\b\s*(?:\(\s*(?P<paren>[a-zA-Z_]\w*)\s*\)|(?P<name>[a-zA-Z_]\w*))"
+)
+
+#: Python spelling of the preprocessor operators that differ from C.
+_pp_operators = {"!": " not ", "&&": " and ", "||": " or "}
+
+#: Regex matching the preprocessor operators to translate and the identifiers
+#: left after macro expansion.
+_pp_expr_regex = re.compile(r"!(?!=)|&&|\|\||[a-zA-Z_][a-zA-Z0-9_]*")
+
+#: Regex matching identifiers outside of string literals.
+_identifier_regex = re.compile(r'"(?:\\"|[^"])*"|\b(?P<name>\w+)\b')
+
+
+#: Regex matching the tokens relevant to split the arguments of a macro call.
+_macro_call_regex = re.compile(r""""(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*'|[(),]""")
+
+
+def _split_macro_args(text):
+    """Split the arguments of a function macro call.
+
+    Parameters
+    ----------
+    text : str
+        Text following the name of the macro, starting with the parenthesized
+        arguments.
+
+    Returns
+    -------
+    args : list
+        Stripped text of each argument. Commas inside nested parentheses or
+        string literals do not separate arguments.
+
+    end : str
+        Text following the closing parenthesis.
+
+    """
+    start = len(text) - len(text.lstrip())
+    if not text.startswith("(", start):
+        raise ValueError("No argument list in {!r}".format(text))
+
+    args = []
+    depth = 0
+    arg_start = start + 1
+    for m in _macro_call_regex.finditer(text, start):
+        token = m.group()
+        if token == "(":
+            depth += 1
+        elif token == ")":
+            depth -= 1
+            if depth == 0:
+                args.append(text[arg_start : m.start()].strip())
+                return args, text[m.end() :]
+        elif token == "," and depth == 1:
+            args.append(text[arg_start : m.start()].strip())
+            arg_start = m.end()
+
+    raise ValueError("Unbalanced parentheses in {!r}".format(text))
+
+
+@lru_cache(maxsize=4096)
+def _fn_macro_arg_regex(args):
+    """Regex matching the arguments of a function macro outside of strings.
+
+    Headers commonly define many function macros sharing the same argument
+    names, so the compiled patterns are cached per tuple of arguments.
+
+    """
+    args_str = "|".join(map(re.escape, args)) or "(?!)"
+    return re.compile(r'"(?:\\"|[^"])*"|\b(?P<arg>{})\b'.format(args_str))
+
+
+def _escape_braces(text):
+    """Escape literal braces so that text can be embedded in a format string."""
+    return text.replace("{", "{{").replace("}", "}}")
+
+
+@lru_cache(maxsize=4096)
+def _fn_macro_literals(fmt):
+    """Split a compiled function macro body around its argument slots.
+
+    Returns the literal fragments of the format string, one more than the
+    number of arguments, so that expanding a macro does not parse the format
+    string again.
+
+    """
+    literals = [""]
+    for literal, field, _, _ in Formatter().parse(fmt):
+        literals[-1] += literal
+        if field is not None:
+            literals.append("")
+    return tuple(literals)
+
+
+@lru_cache(maxsize=4096)
+def _eval_preprocessor_expr(expr):
+    """Evaluate the condition of a #if or #elif directive.
+
+    The expression must already have its macros expanded, any identifier left
+    is undefined and hence evaluates to 0. The same conditions are repeated
+    across headers so results are cached.
+
+    """
+    # Make a few alterations so the expression can be eval'd
+    expr2 = _pp_expr_regex.sub(
+        lambda m: _pp_operators.get(m.group(), "0"), expr
+    ).strip()
+
+    try:
+        ev = bool(eval(expr2))
+    except Exception:
+        mess = "Error evaluating preprocessor expression: {} [{}]\n{}"
+        logger.debug(mess.format(expr, repr(expr2), format_exc()))
+        ev = False
+    return ev
+
+
 def print_parse_results(pr, depth=0, name=""):
     """For debugging; pretty-prints parse result objects."""
     start = name + " " * (20 - len(name)) + ":" + ".." * depth
@@ -1804,6 +1994,15 @@ name = WordStart(wordchars) + Word(alphas + "_", alphanums + "_$") + WordEnd(wor
 size_modifiers = ["short", "long"]
 sign_modifiers = ["signed", "unsigned"]
 
+# Preprocessor
+macro_name = Word(alphas + "_", alphanums + "_")("name").setWhitespaceChars(" \t")
+macro_args = Optional(lparen + delimitedList(macro_name) + rparen)
+pp_define = (
+    macro_name("macro")
+    + macro_args.setWhitespaceChars(" \t")("args")
+    + SkipTo(LineEnd())("value")
+)
+
 # Syntax elements defined by _init_parser.
 expression = Forward()
 array_op = lbrack + expression + rbrack
@@ -1829,18 +2028,31 @@ c99_int_types = [
 num_types = ["int", "float", "double", *c99_int_types]
 nonnum_types = ["char", "bool", "void"]
 
+# Words allowed in a fundamental type (extended by _init_cparser).
+fund_type_words = frozenset(
+    [*num_types, *nonnum_types, *size_modifiers, *sign_modifiers]
+)
+
 
 # Define some common language elements when initialising.
-def _init_cparser(extra_types=None, extra_modifiers=None):
+def _init_cparser(extra_types=None, extra_modifiers=None, packrat=0):
     global expression
     global call_conv, ident
     global base_types
     global type_qualifier, storage_class_spec, extra_modifier
     global fund_type
-    global extra_type_list
+    global extra_type_list, fund_type_words
+
+    # Packrat parsing is a global pyparsing setting, it mostly adds overhead
+    # on header grammars hence it is only used when requested.
+    if packrat != 0:
+        ParserElement.enablePackrat(packrat)
 
     # Some basic definitions
     extra_type_list = [] if extra_types is None else list(extra_types)
+    fund_type_words = frozenset(
+        [*num_types, *nonnum_types, *size_modifiers, *sign_modifiers, *extra_type_list]
+    )
     base_types = nonnum_types + num_types + extra_type_list
     storage_classes = ["inline", "static", "extern"]
     qualifiers = ["const", "volatile", "restrict", "near", "far"]
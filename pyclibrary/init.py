@@ -19,7 +19,7 @@ from .c_library import CLibrary
 from .c_parser import CParser, _init_cparser
 
 
-def init(extra_types=None, extra_modifiers=None):
+def init(extra_types=None, extra_modifiers=None, packrat=0):
     """Init CParser and CLibrary classes.
 
     Parameters
@@ -28,6 +28,10 @@ def init(extra_types=None, extra_modifiers=None):
         typeName->c_type pairs to extend typespace.
     extra_modifiers : list, optional
         List of modifiers, such as '__stdcall'.
+    packrat : int or None, optional
+        Size of the pyparsing packrat cache used when parsing headers. None
+        means an unbounded cache and 0, the default, disables packrat parsing.
+        This setting applies to all pyparsing grammars.
 
     """
     if CParser._init or CLibrary._init:
@@ -36,7 +40,7 @@ def init(extra_types=None, extra_modifiers=None):
     extra_types = extra_types if extra_types else {}
     extra_modifiers = extra_modifiers if extra_modifiers else []
 
-    _init_cparser(extra_types.keys(), extra_modifiers)
+    _init_cparser(extra_types.keys(), extra_modifiers, packrat)
     init_libraries(extra_types)
 
     CParser._init = True
@@ -57,7 +61,7 @@ WIN_MODIFIERS = [
 ]
 
 
-def auto_init(extra_types=None, extra_modifiers=None, os=None):
+def auto_init(extra_types=None, extra_modifiers=None, os=None, packrat=0):
     """Init CParser and CLibrary classes based on the targeted OS.
 
     Parameters
@@ -69,6 +73,8 @@ def auto_init(extra_types=None, extra_modifiers=None, os=None):
     os : {'win32', 'linux2', 'darwin'}, optional
         OS for which to prepare the system. If not specified sys is used to
         identify the OS.
+    packrat : int or None, optional
+        Size of the pyparsing packrat cache, see init.
 
     """
     extra_types = extra_types if extra_types else {}
@@ -78,4 +84,4 @@ def auto_init(extra_types=None, extra_modifiers=None, os=None):
         extra_types.update(WIN_TYPES)
         extra_modifiers += WIN_MODIFIERS
 
-    init(extra_types, extra_modifiers)
+    init(extra_types, extra_modifiers, packrat)
@@ -54,6 +54,10 @@ class TestCTypesCLibrary(object):
     def test_getitem(self):
         assert self.library["values"]["an_integer"] == 42
 
+    def test_contains(self):
+        assert "values" in self.library
+        assert "an_integer" not in self.library
+
     def test_make_struct(self):
         self.library.BITS
 
@@ -85,6 +89,43 @@ class TestCTypesCLibrary(object):
         assert test_point.x == arg.x
         assert test_point.y == arg.y
 
+    def test_function_call_kwargs(self):
+        # Test passing arguments by name.
+        arg = self.library.point(x=1, y=2)
+        res, (_, test_point) = self.library._testfunc_byval(**{"in": arg})
+        assert res == 3
+        assert test_point.x == arg.x
+
+        with pytest.raises(TypeError):
+            self.library._testfunc_byval(arg, out=None)
+
+    def test_function_call_null_pointer(self):
+        # Test passing None to build a NULL pointer.
+        arg = self.library.point(x=1, y=2)
+        res, (_, test_point) = self.library._testfunc_byval(arg, None)
+        assert res == 3
+        assert not test_point
+
+        with pytest.raises(TypeError):
+            self.library._testfunc_byval(None)
+
+    def test_function_call_missing_argument(self):
+        # Test omitting an argument which cannot be built automatically.
+        with pytest.raises(TypeError):
+            self.library._testfunc_byval()
+
+    def test_call_result(self):
+        # Test accessing the arguments stored in the result of a call.
+        arg = self.library.point(x=1, y=2)
+        res = self.library._testfunc_byval(arg)
+        _, args = res
+        assert isinstance(args, tuple)
+        assert res["pout"].x == arg.x
+        assert res.auto()[0].y == arg.y
+
+        with pytest.raises(KeyError):
+            res["unknown"]
+
     def test_function_call4(self):
         """Test calling a funcùtion returning a string
 
@@ -123,3 +164,13 @@ class TestCachedCTypesLibrary(TestCTypesCLibrary):
 
     def teardown(self):
         type(self.library).libs.clear()
+
+
+def test_locked_function_call():
+    """Test calling a function when calls to the library are locked."""
+    CLibrary.libs.clear()
+    try:
+        library = CLibrary(_ctypes_test.__file__, ["ctypes_test.h"], lock_calls=True)
+        assert library.get_an_integer()() == 42
+    finally:
+        CLibrary.libs.clear()
@@ -13,6 +13,15 @@
   int NO_DECLARE_IF;
 #endif
 
+// Test if defined with parentheses
+#if defined(MACRO) && !defined( UNDEFINED )
+    #define DEFINE_IF_PAREN
+#endif
+
+#if defined(UNDEFINED)
+  #define NO_DEFINE_IF_PAREN
+#endif
+
 // Test ifdef
 #ifdef MACRO
   #define DEFINE_IFDEF
@@ -94,6 +103,10 @@
   int DECLARE_LOG;
 #endif
 
+#if VAL1 != 5 || !VAL1
+  #define DEFINE_NEQ
+#endif
+
 // Test undef
 #define UNDEF
 #ifdef UNDEF
@@ -23,3 +23,16 @@
 
 // Test handling of unknown pragmas
 #pragma omp parallel
+
+// Invalid packings are ignored
+#pragma pack(4)
+#pragma pack(3)
+
+// Pop with an identifier used several times stops at the most recent one
+#pragma pack(push, dup, 2)
+#pragma pack(push, dup, 8)
+#pragma pack(pop, dup)
+
+// Push and pop are applied even when the packing value is invalid
+#pragma pack(push, 3)
+#pragma pack(pop)
@@ -11,6 +11,7 @@ import pyclibrary.c_library as cl
 import pyclibrary.c_parser as cp
 import pytest
 from pyclibrary.init import auto_init, init
+from pyparsing import ParserElement
 
 
 @pytest.fixture
@@ -35,6 +36,18 @@ def test_reinit_attempt(init_fixture):
         init()
 
 
+def test_packrat(init_fixture, monkeypatch):
+    calls = []
+    monkeypatch.setattr(ParserElement, "enablePackrat", calls.append)
+    init()
+    assert calls == []
+
+    cp.CParser._init = False
+    cl.CLibrary._init = False
+    init(packrat=128)
+    assert calls == [128]
+
+
 def test_auto_init(init_fixture):
     auto_init({"new_type": int}, ["__modifier"], "win32")
     assert "new_type" in cp.base_types
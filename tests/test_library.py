@@ -17,6 +17,8 @@ import os
 
 import pytest
 from pyclibrary.c_library import CLibrary
+from pyclibrary.c_parser import CParser, Type
+from pyclibrary.errors import PyCLibError
 from pyclibrary.utils import (
     HEADER_DIRS,
     LIBRARY_DIRS,
@@ -72,10 +74,111 @@ class TestCLibrary(object):
         assert library is CLibrary(_ctypes_test.__file__, ["ctypes_test.h"])
 
     def test_accessing_prefixed_value(self):
-        pass
+        CLibrary.libs.clear()
+        try:
+            library = CLibrary(_ctypes_test.__file__, ["ctypes_test.h"], prefix="get_")
+            func = library("functions", "get_an_integer")
+            assert library("functions", "an_integer") is func
+            assert library.an_integer == 42
+        finally:
+            CLibrary.libs.clear()
 
 
 def test_function_pretty_signature():
     """Test building the pretty signature of a function."""
     library = CLibrary(os.path.basename(_ctypes_test.__file__), ["ctypes_test.h"])
     library.my_strdup.pretty_signature()
+
+
+def test_lazy_header_parsing():
+    """Test that headers are only parsed when the definitions are needed."""
+    CLibrary.libs.clear()
+    library = CLibrary(_ctypes_test.__file__, ["ctypes_test.h"])
+    assert "_headers_" not in vars(library)
+    assert library.an_integer == 42
+    assert "_headers_" in vars(library)
+
+
+def test_header_parsing_attribute_error(monkeypatch):
+    """Test that an AttributeError raised while parsing headers is not lost."""
+
+    def build_parser(self, headers, kwargs):
+        raise AttributeError("broken")
+
+    CLibrary.libs.clear()
+    try:
+        library = CLibrary(_ctypes_test.__file__, ["ctypes_test.h"])
+        monkeypatch.setattr(type(library), "_build_parser", build_parser)
+        with pytest.raises(PyCLibError) as excinfo:
+            library.an_integer
+        assert isinstance(excinfo.value.__cause__, AttributeError)
+
+        with pytest.raises(AttributeError):
+            library.__deepcopy__
+    finally:
+        CLibrary.libs.clear()
+
+
+def test_underscore_wrapped_definitions(tmp_path):
+    """Test accessing definitions whose names start and end with underscores."""
+    header = tmp_path / "underscores.h"
+    header.write_text("#define _SOME_MACRO_ 1\n#define __LIB_VERSION__ 2\n")
+    CLibrary.libs.clear()
+    try:
+        library = CLibrary(_ctypes_test.__file__, [str(header)])
+        assert library._SOME_MACRO_ == 1
+        assert library.__LIB_VERSION__ == 2
+    finally:
+        CLibrary.libs.clear()
+
+
+def test_function_signature_is_a_list():
+    """Test that the signature of a function keeps its list based layout."""
+    library = CLibrary(os.path.basename(_ctypes_test.__file__), ["ctypes_test.h"])
+    sig = library._testfunc_byval.sig
+    assert isinstance(sig, list)
+    assert isinstance(sig[1], list)
+    assert [a[0] for a in sig[1]] == ["in", "pout"]
+
+
+def test_function_calling_convention(tmp_path):
+    """Test wrapping a function declared with a calling convention."""
+    header = tmp_path / "call_conv.h"
+    header.write_text("int __cdecl get_an_integer(void);\n")
+    CLibrary.libs.clear()
+    try:
+        library = CLibrary(_ctypes_test.__file__, CParser([str(header)]))
+        assert library.get_an_integer.sig[0] == ("int",)
+        assert library.get_an_integer()() == 42
+    finally:
+        CLibrary.libs.clear()
+
+
+def test_array_typedef_is_not_modified(tmp_path):
+    """Test that building an array of an array typedef leaves the typedef intact."""
+    header = tmp_path / "arrays.h"
+    header.write_text("typedef int arr5[5];\narr5 arrs[3];\n")
+    CLibrary.libs.clear()
+    try:
+        parser = CParser([str(header)])
+        library = CLibrary(_ctypes_test.__file__, parser)
+        typ = parser.defs["variables"]["arrs"][1]
+        assert library._get_type(typ) is library._get_type(typ)
+        assert parser.defs["types"]["arr5"] == Type("int", [5])
+    finally:
+        CLibrary.libs.clear()
+
+
+def test_type_cache_follows_typedef_redefinition(tmp_path):
+    """Test that the cached types are dropped when a typedef is redefined."""
+    header = tmp_path / "redefine.h"
+    header.write_text("typedef int my_type;\n")
+    CLibrary.libs.clear()
+    try:
+        parser = CParser([str(header)])
+        library = CLibrary(_ctypes_test.__file__, parser)
+        assert library._get_type_cached(Type("my_type")) is ctypes.c_int
+        parser.add_def("types", "my_type", Type("double"))
+        assert library._get_type_cached(Type("my_type")) is ctypes.c_double
+    finally:
+        CLibrary.libs.clear()
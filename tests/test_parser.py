@@ -8,12 +8,14 @@
 """Test parser functionalities."""
 
 import os
+import re
 import sys
 from pickle import dumps, loads
 
 import pyclibrary.utils
 import pytest
 from pyclibrary.c_parser import CParser, Enum, Struct, Type, Union
+from pyclibrary.errors import DefinitionError
 
 H_DIRECTORY = os.path.join(os.path.dirname(__file__), "headers")
 
@@ -32,6 +34,7 @@ class TestType(object):
     def test_tuple_equality(self):
         assert Type("int") == ("int",)
         assert ("int",) == Type("int")
+        assert Type("int") != 1
 
         assert Type("int", "*", type_quals=[["const"], ["volatile"]]) == ("int", "*")
 
@@ -85,6 +88,10 @@ class TestType(object):
         ) == Type(
             "int", "*", [1], type_quals=(("__tq1",), ("__tq2", "__tq3"), ("__tq4",))
         )
+        assert Type("signed int", "*").eval(type_map) == Type("int", "*")
+        assert Type("unsigned int").eval(type_map) == Type("unsigned int")
+        fund_type = Type("int", "*")
+        assert fund_type.eval(type_map) is fund_type
 
     def test_compatibility_hack(self):
         assert Type("int", "*", ()).add_compatibility_hack() == Type(
@@ -149,6 +156,7 @@ class TestStructUnion(object):
             + repr(self.TEST_MEMBERS[1])
             + ", pack=2)"
         )
+        assert repr(Struct(pack=2)) == "Struct(pack=2)"
         assert repr(Union()) == "Union()"
 
 
@@ -361,6 +369,9 @@ class TestPreprocessing(object):
         # Muliline macro
         assert "MACRO_ML" in macros and values["MACRO_ML"] == 2
 
+        # Macros following a string literal are expanded too
+        assert self.parser.expand_macros('f("NESTED", NESTED)') == 'f("NESTED", 1)'
+
     def test_conditionals(self):
         path = os.path.join(self.h_dir, "macro_conditionals.h")
         self.parser.load_file(path)
@@ -377,6 +388,10 @@ class TestPreprocessing(object):
         assert "NO_DEFINE_IF" not in macros
         assert "  int NO_DECLARE_IF;\n" not in stream
 
+        # Test if defined with parentheses
+        assert "DEFINE_IF_PAREN" in macros
+        assert "NO_DEFINE_IF_PAREN" not in macros
+
         # Test ifdef conditional
         assert "DEFINE_IFDEF" in macros
         assert "  int DECLARE_IFDEF;\n" in stream
@@ -422,11 +437,16 @@ class TestPreprocessing(object):
         assert "  int DECLARE_LOG;\n" in stream
         assert "NO_DEFINE_LOG" not in macros
         assert "NO_DEFINE_LOG" not in macros
+        assert "DEFINE_NEQ" in macros
 
         # Test undef
         assert "DEFINE_UNDEF" in macros
         assert "UNDEF" not in macros
 
+        # Lines skipped inside inactive blocks are kept blank
+        with open(path) as f:
+            assert stream.count("\n") == f.read().count("\n")
+
     def test_macro_function(self):
         path = os.path.join(self.h_dir, "macro_functions.h")
         self.parser.load_file(path)
@@ -466,6 +486,27 @@ class TestPreprocessing(object):
         assert "SETBIT_AUTO" in fnmacros
         assert "int z3 = ((((3) |= (0x01)), ((3) |= (0x01))));" in stream
 
+        # Test expanding a macro function whose body contains braces
+        fnmacros["BLOCK"] = self.parser.compile_fn_macro(
+            "do { f(x); } while (0)", ["x"]
+        )
+        assert self.parser.expand_fn_macro("BLOCK", "(a);") == (
+            "do { f(a); } while (0)",
+            ";",
+        )
+
+        # Test arguments containing parentheses, commas and strings
+        assert self.parser.expand_fn_macro("CARRE", " ((1 + 2));") == (
+            "(1 + 2)*(1 + 2)",
+            ";",
+        )
+        assert self.parser.expand_fn_macro("SETBIT", '(f(a, b), ",)")') == (
+            '((f(a, b)) |= (",)"))',
+            "",
+        )
+        with pytest.raises(DefinitionError):
+            self.parser.expand_fn_macro("CARRE", "(1")
+
     def test_pragmas(self):
         path = os.path.join(self.h_dir, "pragmas.h")
         self.parser.load_file(path)
@@ -487,6 +528,13 @@ class TestPreprocessing(object):
         assert packings[6][1] == 4
         assert packings[7][1] == 16
         assert packings[8][1] is None
+        assert packings[9][1] == 4
+        assert packings[10][1] == 2
+        assert packings[11][1] == 8
+        assert packings[12][1] == 2
+        assert packings[13][1] is None
+        assert packings[14][1] == 2
+        assert len(packings) == 15
 
 
 class TestParsing(object):
@@ -681,7 +729,20 @@ class TestParsing(object):
         assert "typeTypeInt" in types and types["typeTypeInt"] == Type("typeInt")
         assert not self.parser.is_fund_type("typeTypeInt")
         assert self.parser.eval_type(["typeTypeInt"]) == Type("int")
+        assert self.parser.eval_type(Type("typeIntPtr", "*", [2])) == Type(
+            "int", "*", "*", [2]
+        )
+        assert self.parser.eval_type(
+            Type("voidpc", "*", type_quals=(("const",), ()))
+        ) == Type("void", "*", "*", type_quals=(("const",), ("const",), ()))
+        self.parser.add_def("types", "typeInt", Type("char"))
+        assert self.parser.eval_type(["typeTypeInt"]) == Type("char")
+        self.parser.add_def("types", "typeInt", Type("int"))
         assert "ULONG" in types and types["ULONG"] == Type("unsigned long")
+        assert self.parser.find("typeInt") == [("typedefs.h", "types")]
+        assert ("typedefs.h", "types", "typeIntPtr") in self.parser.find(
+            re.compile("typeInt")
+        )
 
         # Test annotated types
         assert "voidpc" in types and types["voidpc"] == Type(
@@ -896,3 +957,13 @@ class TestParsing(object):
         assert functions.get("typeQualedFunc") == Type(
             Type("int"), ((None, ptyp, None),)
         )
+
+    def test_copy_from(self):
+        path = os.path.join(self.h_dir, "typedefs.h")
+        self.parser.load_file(path)
+        self.parser.process_all()
+
+        parser = CParser(copy_from=self.parser, process_all=False)
+        assert parser.defs == self.parser.defs
+        assert parser.file_defs == self.parser.file_defs
+        assert parser.eval_type(["typeTypeInt"]) == Type("int")